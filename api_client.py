@@ -15,12 +15,18 @@ import undetected_chromedriver as uc
 from pathlib import Path
 
 from models import Session, ChatCompletionRequest
+from response_processor import process_normal_request
+from event_logger import log_event
 from settings import (BASE_URL,API_URL,RETRY_WAIT_SECONDS,NEW_SESSION_RETRIES,HEADERS,PROXY_PROTOCOL,PROXY_HOST,PROXY_PORT,PROXY_AUTH,PROXY_USERNAME,PROXY_PASSWORD)
 
 # cookies and user agent to bypass Cloudflare and ChatGPT rate limit
 _cookies = None
 _user_agent = None
 
+# Lets concurrent callers share a single browser cookie fetch, created lazily
+# inside the running event loop
+_cookies_lock = None
+
 # HTTPX client with predefined configuration
 client = httpx.AsyncClient()
 client.headers.update(HEADERS)
@@ -99,29 +105,45 @@ def get_cookies_and_user_agent(url, timeout=60):
 
     return cookies, user_agent
 
+async def ensure_cookies_and_user_agent() -> tuple[list, str]:
+    """Returns the cached cookies and user agent, fetching them off the event loop if missing."""
+    global _cookies, _user_agent, _cookies_lock
+
+    if _cookies_lock is None:
+        _cookies_lock = asyncio.Lock()
+
+    async with _cookies_lock:
+        if not _cookies or not _user_agent:
+            _cookies, _user_agent = await asyncio.to_thread(
+                get_cookies_and_user_agent, BASE_URL
+            )
+
+        return _cookies, _user_agent
+
 async def get_new_session(retries: int = 0) -> Optional[Session]:
     """Gets a new session ID and token from the OpenAI API."""
     global _cookies, _user_agent
 
+    used_cookies = None
+
     try:
-        if not _cookies or not _user_agent:
-            _cookies , _user_agent = get_cookies_and_user_agent(BASE_URL)
+        used_cookies, user_agent = await ensure_cookies_and_user_agent()
         
-        _version , _operation_system = extract_version_and_os(_user_agent)
+        _version , _operation_system = extract_version_and_os(user_agent)
         
         device_id = str(uuid.uuid4())
         
         _headers = {
             **HEADERS,
-            "user-agent": _user_agent,
-            "sec-ch-ua": f'"{_user_agent}";v="{_version}"',
+            "user-agent": user_agent,
+            "sec-ch-ua": f'"{user_agent}";v="{_version}"',
             "sec-ch-ua-mobile": "?0",
             "sec-ch-ua-platform": f'"{_operation_system}"',
             "oai-device-id": device_id,
         }
 
         # Generate the cookies dictionary
-        cookies = {cookie['name']: cookie['value'] for cookie in _cookies}
+        cookies = {cookie['name']: cookie['value'] for cookie in used_cookies}
         
         response = await client.post(
             f"{BASE_URL}/backend-anon/sentinel/chat-requirements", headers=_headers,
@@ -137,13 +159,23 @@ async def get_new_session(retries: int = 0) -> Optional[Session]:
         
         return Session(**session_data)
     except Exception as e:
-        print(f"Error getting a new session (attempt {retries+1}/{NEW_SESSION_RETRIES}): {str(e)}")
+        log_event(
+            "session_request_failed",
+            level="warning",
+            sampled=True,
+            attempt=retries + 1,
+            retries=NEW_SESSION_RETRIES,
+            error=str(e),
+        )
         
         if retries < NEW_SESSION_RETRIES:
             await asyncio.sleep(RETRY_WAIT_SECONDS)
             
-            _cookies = None
-            _user_agent = None
+            # Only drop the cookies this attempt used, not ones another caller
+            # has fetched again in the meantime
+            if used_cookies is not None and _cookies is used_cookies:
+                _cookies = None
+                _user_agent = None
             
             return await get_new_session(retries + 1)
         
@@ -180,7 +212,9 @@ def generate_proof_token(seed: str, diff: str, user_agent: str) -> str:
 async def send_chat_completion_request(request: ChatCompletionRequest, session: Session) -> AsyncIterator[str]:
     """Sends a chat completion request to the OpenAI API, handling streaming if requested."""
 
-    _proof_token = generate_proof_token(
+    # The proof of work is CPU bound, keep it off the event loop
+    _proof_token = await asyncio.to_thread(
+        generate_proof_token,
         session.proofofwork["seed"],
         session.proofofwork["difficulty"],
         session.headers.get("user-agent"),
@@ -219,4 +253,17 @@ async def send_chat_completion_request(request: ChatCompletionRequest, session:
     ) as response:
         response.raise_for_status()
         async for chunk in response.aiter_lines():
-            yield chunk
\ No newline at end of file
+            yield chunk
+
+async def batch_chat_completion(body: dict) -> dict:
+    """Runs a chat completion batch line as a non-streaming request."""
+    chat_completion_request = ChatCompletionRequest(**body)
+
+    session = await get_new_session()
+    if not session:
+        raise RuntimeError("Failed to obtain a session from OpenAI API")
+
+    response = send_chat_completion_request(chat_completion_request, session)
+    return json.loads(
+        await process_normal_request(chat_completion_request.messages, response)
+    )
@@ -0,0 +1,441 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+from models import Batch, BatchRequestLine
+from event_logger import log_event, set_request_id
+from settings import (
+    BATCH_DIR,
+    BATCH_CONCURRENCY,
+    BATCH_MAX_INTERACTIVE_REQUESTS,
+    BATCH_MAX_YIELD_SECONDS,
+)
+
+# Executors for the endpoints a batch line may target, registered by the server
+BatchHandler = Callable[[dict], Awaitable[dict]]
+_handlers: Dict[str, BatchHandler] = {}
+
+# Known batches and the tasks running them
+_batches: Dict[str, Batch] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+
+# Shared between all batches, created lazily inside the running event loop
+_worker_slots: Optional[asyncio.Semaphore] = None
+_interactive_idle: Optional[asyncio.Event] = None
+_interactive_requests = 0
+
+# Statuses a batch can be resumed from after a restart
+_RESUMABLE_STATUSES = ("validating", "in_progress", "cancelling")
+
+# Stored progress is refreshed every this many results; output.jsonl stays the
+# source of truth and the counts are recomputed from it on resume
+_PROGRESS_SAVE_INTERVAL = 100
+
+# Output files can grow large, so they are only ever read in chunks this size
+_OUTPUT_CHUNK_SIZE = 64 * 1024
+
+
+def register_batch_handler(url: str, handler: BatchHandler) -> None:
+    """Registers the coroutine executing batch lines that target the given url."""
+    _handlers[url] = handler
+
+
+def _get_worker_slots() -> asyncio.Semaphore:
+    global _worker_slots
+    if _worker_slots is None:
+        _worker_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    return _worker_slots
+
+
+def _get_interactive_idle() -> asyncio.Event:
+    global _interactive_idle
+    if _interactive_idle is None:
+        _interactive_idle = asyncio.Event()
+        if _interactive_requests <= BATCH_MAX_INTERACTIVE_REQUESTS:
+            _interactive_idle.set()
+    return _interactive_idle
+
+
+def _change_interactive_requests(delta: int) -> None:
+    global _interactive_requests
+
+    _interactive_requests += delta
+    if _interactive_requests <= BATCH_MAX_INTERACTIVE_REQUESTS:
+        _get_interactive_idle().set()
+    else:
+        _get_interactive_idle().clear()
+
+
+class InteractiveRequest:
+    """An interactive request in flight, released once by its handler or its response stream."""
+
+    def __init__(self):
+        self.handed_off = False
+        self._released = False
+        _change_interactive_requests(1)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            _change_interactive_requests(-1)
+
+
+@asynccontextmanager
+async def interactive_request() -> AsyncIterator[InteractiveRequest]:
+    """Marks an interactive request as in flight so low priority batches step aside."""
+    request = InteractiveRequest()
+    try:
+        yield request
+    finally:
+        if not request.handed_off:
+            request.release()
+
+
+def hold_interactive_request(
+    request: InteractiveRequest, stream: AsyncIterator[str]
+) -> AsyncIterator[str]:
+    """Hands a request's in-flight marker to its response stream, without a gap."""
+    request.handed_off = True
+    held = _release_when_consumed(request, stream)
+
+    # A stream dropped before it is ever iterated, e.g. when the client has
+    # already gone, never runs its finally block
+    weakref.finalize(held, _release_soon, asyncio.get_running_loop(), request)
+
+    return held
+
+
+async def _release_when_consumed(
+    request: InteractiveRequest, stream: AsyncIterator[str]
+) -> AsyncIterator[str]:
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        request.release()
+
+
+def _release_soon(loop: asyncio.AbstractEventLoop, request: InteractiveRequest) -> None:
+    try:
+        loop.call_soon_threadsafe(request.release)
+    except RuntimeError:
+        pass  # The loop is already closed
+
+
+async def _wait_for_interactive_idle() -> None:
+    try:
+        await asyncio.wait_for(_get_interactive_idle().wait(), BATCH_MAX_YIELD_SECONDS)
+    except asyncio.TimeoutError:
+        pass  # Let a line through so steady interactive traffic cannot starve the batch
+
+
+def _batch_path(batch_id: str) -> Path:
+    return BATCH_DIR / batch_id
+
+
+def _save_batch(batch: Batch) -> None:
+    state_file = _batch_path(batch.id) / "batch.json"
+    temp_file = state_file.with_suffix(".tmp")
+    temp_file.write_text(batch.model_dump_json(), encoding="utf-8")
+    temp_file.replace(state_file)
+
+
+def _set_status(batch: Batch, status: str, timestamp_field: Optional[str] = None) -> None:
+    batch.status = status
+    if timestamp_field:
+        setattr(batch, timestamp_field, int(time.time()))
+    _save_batch(batch)
+
+
+def _parse_input(content: bytes) -> List[BatchRequestLine]:
+    """Validates a JSONL batch input, raising ValueError on the first invalid line."""
+    lines = []
+    custom_ids = set()
+
+    for line_number, raw_line in enumerate(content.decode("utf-8").splitlines(), 1):
+        if not raw_line.strip():
+            continue
+
+        try:
+            line = BatchRequestLine.model_validate_json(raw_line)
+        except Exception as e:
+            raise ValueError(f"line {line_number}: {e}") from e
+
+        if line.method.upper() != "POST":
+            raise ValueError(f"line {line_number}: unsupported method {line.method}")
+        if line.url not in _handlers:
+            raise ValueError(f"line {line_number}: unsupported url {line.url}")
+        if line.custom_id in custom_ids:
+            raise ValueError(f"line {line_number}: duplicate custom_id {line.custom_id}")
+
+        custom_ids.add(line.custom_id)
+        lines.append(line)
+
+    if not lines:
+        raise ValueError("batch input file is empty")
+
+    return lines
+
+
+def _load_output_progress(output_file: Path) -> tuple[Set[str], int, int]:
+    """
+    Reads the results already written for a batch.
+
+    A line cut short by a crash is truncated away so that appending can continue.
+
+    Returns:
+        tuple: The finished custom ids, the completed count and the failed count.
+    """
+    finished_ids = set()
+    completed = failed = 0
+
+    if not output_file.exists():
+        return finished_ids, completed, failed
+
+    with open(output_file, "r+b") as file:
+        complete_size = 0
+
+        for raw_line in file:
+            if not raw_line.endswith(b"\n"):
+                break
+
+            complete_size += len(raw_line)
+            result = json.loads(raw_line)
+            finished_ids.add(result["custom_id"])
+            if result.get("error"):
+                failed += 1
+            else:
+                completed += 1
+
+        if complete_size != os.fstat(file.fileno()).st_size:
+            file.truncate(complete_size)
+
+    return finished_ids, completed, failed
+
+
+async def _execute_line(batch: Batch, line: BatchRequestLine, output) -> None:
+    """Runs a single batch line and appends its result to the output file."""
+    set_request_id(f"{batch.id}:{line.custom_id}")
+
+    result = {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": line.custom_id,
+        "response": None,
+        "error": None,
+    }
+
+    try:
+        body = await _handlers[line.url](line.body)
+        result["response"] = {
+            "status_code": 200,
+            "request_id": str(uuid.uuid4()),
+            "body": body,
+        }
+        batch.request_counts["completed"] += 1
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        result["error"] = {"code": type(e).__name__, "message": str(e)}
+        log_event("batch_line_failed", level="warning", sampled=True, error=str(e))
+        batch.request_counts["failed"] += 1
+
+    # A single write between awaits keeps concurrent lines from interleaving
+    output.write(json.dumps(result) + "\n")
+    output.flush()
+
+    finished = batch.request_counts["completed"] + batch.request_counts["failed"]
+    if finished % _PROGRESS_SAVE_INTERVAL == 0:
+        _save_batch(batch)
+
+
+async def _run_batch(batch: Batch) -> None:
+    """Feeds the lines of a batch that have no result yet to the worker pool."""
+    batch_path = _batch_path(batch.id)
+    output_file = batch_path / "output.jsonl"
+    pending: Set[asyncio.Task] = set()
+
+    finished_ids, completed, failed = _load_output_progress(output_file)
+    batch.request_counts["completed"] = completed
+    batch.request_counts["failed"] = failed
+
+    if batch.status == "cancelling":
+        _set_status(batch, "cancelled", "cancelled_at")
+        return
+
+    if batch.status != "in_progress":
+        _set_status(batch, "in_progress", "in_progress_at")
+
+    try:
+        with open(batch_path / "input.jsonl", "r", encoding="utf-8") as input_file, open(
+            output_file, "a", encoding="utf-8"
+        ) as output:
+            for raw_line in input_file:
+                if not raw_line.strip():
+                    continue
+
+                line = BatchRequestLine.model_validate_json(raw_line)
+                if line.custom_id in finished_ids:
+                    continue
+
+                if batch.priority == "low":
+                    await _wait_for_interactive_idle()
+                await _get_worker_slots().acquire()
+
+                # Released on completion, even if the task is cancelled before it starts
+                task = asyncio.create_task(_execute_line(batch, line, output))
+                task.add_done_callback(lambda _: _get_worker_slots().release())
+                task.add_done_callback(pending.discard)
+                pending.add(task)
+
+            if pending:
+                await asyncio.gather(*pending)
+
+        _set_status(batch, "completed", "completed_at")
+    except asyncio.CancelledError:
+        # Without an explicit cancel the server is shutting down, resume on restart
+        if batch.status == "cancelling":
+            _set_status(batch, "cancelled", "cancelled_at")
+            return
+        raise
+    except Exception as e:
+        batch.errors = str(e)
+        log_event("batch_failed", level="error", batch_id=batch.id, exc_info=True)
+        _set_status(batch, "failed", "failed_at")
+    finally:
+        for task in list(pending):
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        _tasks.pop(batch.id, None)
+
+
+def _start_batch(batch: Batch) -> None:
+    _tasks[batch.id] = asyncio.create_task(_run_batch(batch))
+
+
+async def create_batch(content: bytes, priority: str = "low") -> Batch:
+    """Validates a JSONL input file, stores it and schedules the batch."""
+    if priority not in ("low", "normal"):
+        raise ValueError(f"unsupported priority {priority}")
+
+    lines = _parse_input(content)
+
+    batch = Batch(
+        id=f"batch_{uuid.uuid4().hex}",
+        priority=priority,
+        created_at=int(time.time()),
+    )
+    batch.request_counts["total"] = len(lines)
+
+    batch_path = _batch_path(batch.id)
+    batch_path.mkdir(parents=True)
+    (batch_path / "input.jsonl").write_text(
+        "".join(line.model_dump_json() + "\n" for line in lines), encoding="utf-8"
+    )
+    _save_batch(batch)
+
+    _batches[batch.id] = batch
+    _start_batch(batch)
+
+    return batch
+
+
+def get_batch(batch_id: str) -> Optional[Batch]:
+    """Returns the batch with the given id, if any."""
+    return _batches.get(batch_id)
+
+
+def list_batches() -> List[Batch]:
+    """Returns all known batches, newest first."""
+    return sorted(_batches.values(), key=lambda batch: batch.created_at, reverse=True)
+
+
+def _complete_output_size(file, size: int) -> int:
+    """Finds where the last complete line ends, scanning back from the given size."""
+    end = size
+    while end > 0:
+        start = max(0, end - _OUTPUT_CHUNK_SIZE)
+        file.seek(start)
+        newline = file.read(end - start).rfind(b"\n")
+        if newline != -1:
+            return start + newline + 1
+        end = start
+
+    return 0
+
+
+def _iter_output(output_file: Path, size: int) -> Iterator[bytes]:
+    with open(output_file, "rb") as file:
+        remaining = size
+        while remaining > 0:
+            chunk = file.read(min(_OUTPUT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def read_batch_output(batch_id: str) -> Optional[tuple[Iterator[bytes], int]]:
+    """
+    Returns the results a batch has written so far and their size in bytes.
+
+    The file may still be appended to, so only the complete lines present when
+    this is called are streamed, keeping the size exact.
+    """
+    if batch_id not in _batches:
+        return None
+
+    output_file = _batch_path(batch_id) / "output.jsonl"
+    if not output_file.exists():
+        return None
+
+    with open(output_file, "rb") as file:
+        size = _complete_output_size(file, os.fstat(file.fileno()).st_size)
+
+    return _iter_output(output_file, size), size
+
+
+async def cancel_batch(batch_id: str) -> Optional[Batch]:
+    """Cancels a batch, dropping the lines still in flight."""
+    batch = _batches.get(batch_id)
+    if not batch or batch.status not in _RESUMABLE_STATUSES:
+        return batch
+
+    _set_status(batch, "cancelling")
+
+    task = _tasks.get(batch_id)
+    if task:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    # The task may have been cancelled before it got to record the cancellation
+    if batch.status == "cancelling":
+        _set_status(batch, "cancelled", "cancelled_at")
+
+    return batch
+
+
+def resume_batches() -> None:
+    """Loads stored batches and restarts the ones interrupted by a shutdown."""
+    if not BATCH_DIR.exists():
+        return
+
+    for state_file in BATCH_DIR.glob("*/batch.json"):
+        batch = Batch.model_validate_json(state_file.read_text(encoding="utf-8"))
+        _batches[batch.id] = batch
+
+        if batch.status in _RESUMABLE_STATUSES:
+            _start_batch(batch)
+
+
+async def shutdown_batches() -> None:
+    """Stops running batches while keeping them resumable."""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,107 @@
+"""
+Compares request body decoding in the HTTP handlers on large bodies.
+
+The previous path parsed with json.loads, built the model from the dict and
+then walked the embeddings input again, joining token ids into strings. The
+current one runs the request_decoder functions the handlers use: decoding,
+splitting the embeddings input and validating token ids.
+
+Text tokenization is left out on both sides, since both tokenize each text
+once. The previous path also tokenized the joined token id strings, which is
+left out too, so its token id timings are a lower bound.
+
+Usage:
+    python benchmarks/request_decoding.py
+"""
+import json
+import random
+import string
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import ChatCompletionRequest, EmbeddingsRequest  # noqa: E402
+from request_decoder import (  # noqa: E402
+    decode_request,
+    split_embedding_inputs,
+    prepare_token_ids,
+)
+
+ROUNDS = 20
+
+# Vocabulary and length limit of a typical BERT-style embedding model
+VOCAB_SIZE = 30528
+MAX_LENGTH = 8192
+
+
+def random_text(length: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " ", k=length))
+
+
+def previous_embeddings(raw_body: bytes) -> list:
+    embedding_request = EmbeddingsRequest(**json.loads(raw_body))
+    if isinstance(embedding_request.input, str):
+        return [embedding_request.input]
+    if all(isinstance(x, str) for x in embedding_request.input):
+        return embedding_request.input
+    if all(isinstance(x, list) for x in embedding_request.input):
+        return [" ".join(map(str, x)) for x in embedding_request.input]
+    raise ValueError("Invalid input type")
+
+
+def current_embeddings(raw_body: bytes) -> list:
+    inputs = split_embedding_inputs(decode_request(EmbeddingsRequest, raw_body))
+    if isinstance(inputs[0], str):
+        return inputs
+    return prepare_token_ids(inputs, VOCAB_SIZE, MAX_LENGTH)
+
+
+def previous_chat(raw_body: bytes) -> ChatCompletionRequest:
+    return ChatCompletionRequest(**json.loads(raw_body))
+
+
+def current_chat(raw_body: bytes) -> ChatCompletionRequest:
+    return decode_request(ChatCompletionRequest, raw_body)
+
+
+def bench(name: str, previous, current, raw_body: bytes) -> None:
+    previous_time = min(timeit.repeat(lambda: previous(raw_body), number=1, repeat=ROUNDS))
+    current_time = min(timeit.repeat(lambda: current(raw_body), number=1, repeat=ROUNDS))
+    print(
+        f"{name:<28} {len(raw_body) / 2**20:7.1f} MiB"
+        f"  previous {previous_time * 1000:8.1f} ms"
+        f"  current {current_time * 1000:8.1f} ms"
+        f"  x{previous_time / current_time:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+
+    texts = [random_text(500) for _ in range(4096)]
+    token_ids = [[random.randrange(30000) for _ in range(512)] for _ in range(2048)]
+    messages = [
+        {"role": random.choice(("user", "assistant")), "content": random_text(2000)}
+        for _ in range(500)
+    ]
+
+    bench(
+        "embeddings, text inputs",
+        previous_embeddings,
+        current_embeddings,
+        json.dumps({"input": texts, "model": "bench"}).encode(),
+    )
+    bench(
+        "embeddings, token id inputs",
+        previous_embeddings,
+        current_embeddings,
+        json.dumps({"input": token_ids, "model": "bench"}).encode(),
+    )
+    bench(
+        "chat completion",
+        previous_chat,
+        current_chat,
+        json.dumps({"messages": messages, "stream": False}).encode(),
+    )
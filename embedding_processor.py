@@ -0,0 +1,181 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from models import EmbeddingsRequest, Embedding, EmbeddingsResponse
+from request_decoder import split_embedding_inputs, prepare_token_ids
+from settings import EMBEDDING_MODEL
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+embedding_model = AutoModel.from_pretrained(
+    EMBEDDING_MODEL,
+    trust_remote_code=True,
+).to(device)
+embedding_tokenizer = AutoTokenizer.from_pretrained(
+    EMBEDDING_MODEL,
+    trust_remote_code=True,
+)
+
+# The tokenizer knows how many tokens fit, where the position table may hold
+# extra slots (RoBERTa has 514 positions for 512 tokens). Tokenizers without
+# a limit report a huge sentinel instead.
+max_input_tokens = embedding_tokenizer.model_max_length
+if max_input_tokens > 1_000_000:
+    max_input_tokens = embedding_model.config.max_position_embeddings
+
+# Texts embedded both ways at startup to find the model's pooling
+_PROBE_TEXTS = ["The quick brown fox jumps over the lazy dog.", "Embeddings"]
+
+
+def _mean_pooling(token_embeddings: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    mask = attention_mask.unsqueeze(-1).to(token_embeddings.dtype)
+    return (token_embeddings * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+
+
+def _cls_pooling(token_embeddings: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    return token_embeddings[:, 0]
+
+
+_POOLINGS = {"mean": _mean_pooling, "cls": _cls_pooling}
+
+
+def _run_model(inputs: List[List[int]]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Runs the model on a padded batch, returning token embeddings and attention mask."""
+    pad_token_id = embedding_tokenizer.pad_token_id or 0
+    max_length = max(len(token_ids) for token_ids in inputs)
+
+    input_ids = torch.full((len(inputs), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(inputs), max_length), dtype=torch.long)
+    for row, token_ids in enumerate(inputs):
+        input_ids[row, : len(token_ids)] = torch.tensor(token_ids, dtype=torch.long)
+        attention_mask[row, : len(token_ids)] = 1
+
+    input_ids = input_ids.to(device)
+    attention_mask = attention_mask.to(device)
+
+    token_embeddings = embedding_model(input_ids=input_ids, attention_mask=attention_mask)[0]
+    return token_embeddings, attention_mask
+
+
+def _pool(
+    token_embeddings: torch.Tensor,
+    attention_mask: torch.Tensor,
+    pooling: Tuple[str, bool],
+) -> torch.Tensor:
+    name, normalize = pooling
+    pooled = _POOLINGS[name](token_embeddings, attention_mask)
+    if normalize:
+        pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+    return pooled
+
+
+def tokenize(texts: List[str]) -> List[List[int]]:
+    """Tokenizes texts the way the model's own encode does, truncating to the model's limit."""
+    return embedding_tokenizer(texts, truncation=True, max_length=max_input_tokens)[
+        "input_ids"
+    ]
+
+
+def _detect_pooling() -> Optional[Tuple[str, bool]]:
+    """
+    Finds the pooling that makes embedding token ids match the model's own encode.
+
+    Checks that encode_token_ids(tokenize(texts)) is close to encode(texts) for
+    each supported pooling, with and without normalization.
+
+    Returns:
+        tuple: The pooling name and whether to normalize, or None if none match.
+    """
+    with torch.no_grad():
+        expected = embedding_model.encode(_PROBE_TEXTS)
+        if isinstance(expected, torch.Tensor):
+            expected = expected.float().cpu().numpy()
+        expected = np.asarray(expected, dtype=np.float32)
+        token_embeddings, attention_mask = _run_model(tokenize(_PROBE_TEXTS))
+
+        for name in _POOLINGS:
+            for normalize in (False, True):
+                pooling = (name, normalize)
+                actual = _pool(token_embeddings, attention_mask, pooling)
+                actual = actual.float().cpu().numpy()
+                if actual.shape == expected.shape and np.allclose(
+                    actual, expected, rtol=1e-3, atol=1e-4
+                ):
+                    return pooling
+
+    return None
+
+
+# Without a match, text goes through the model's encode and token ids are refused
+token_id_pooling = _detect_pooling()
+
+
+def encode_token_ids(inputs: List[List[int]], batch_size: int = 32) -> list:
+    """
+    Embeds already tokenized inputs, skipping the tokenizer.
+
+    Uses the pooling found to match the model's own encode at startup. Inputs
+    must have been through tokenize or prepare_token_ids.
+    """
+    if token_id_pooling is None:
+        raise ValueError(
+            f"Token id inputs are not supported for {EMBEDDING_MODEL}, "
+            "its pooling could not be matched"
+        )
+
+    embeddings = []
+
+    for start in range(0, len(inputs), batch_size):
+        token_embeddings, attention_mask = _run_model(inputs[start : start + batch_size])
+        pooled = _pool(token_embeddings, attention_mask, token_id_pooling)
+        embeddings.extend(pooled.float().cpu().numpy())
+
+    return embeddings
+
+
+def compute_embeddings(embedding_request: EmbeddingsRequest) -> EmbeddingsResponse:
+    """Calculates the embeddings of an embeddings request."""
+
+    inputs = split_embedding_inputs(embedding_request)
+
+    # Calculate embeddings
+    with torch.no_grad():
+        if isinstance(inputs[0], str) and token_id_pooling is None:
+            # The model's encode tokenizes internally, so usage counts inputs
+            # rather than paying for a second tokenization
+            embeddings = embedding_model.encode(inputs)
+            token_count = len(inputs)
+        else:
+            if isinstance(inputs[0], str):
+                token_ids = tokenize(inputs)
+            else:
+                token_ids = prepare_token_ids(
+                    inputs, embedding_model.config.vocab_size, max_input_tokens
+                )
+
+            embeddings = encode_token_ids(token_ids)
+            token_count = sum(len(ids) for ids in token_ids)
+
+    # Create EmbeddingsResponse
+    return EmbeddingsResponse(
+        object="list",
+        data=[
+            Embedding(object="embedding", index=i, embedding=embedding.tolist())
+            for i, embedding in enumerate(embeddings)
+        ],
+        model=embedding_request.model,
+        usage={
+            "prompt_tokens": token_count,
+            "total_tokens": token_count,
+        },  # adjust usage stats as needed
+    )
+
+
+async def batch_embeddings(body: dict) -> dict:
+    """Runs an embeddings batch line off the event loop."""
+    embedding_request = EmbeddingsRequest(**body)
+    embedding_response = await asyncio.to_thread(compute_embeddings, embedding_request)
+    return embedding_response.model_dump()
@@ -0,0 +1,176 @@
+import atexit
+import contextvars
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+import uuid
+from typing import Optional
+
+from settings import LOG_LEVEL, LOG_BUFFER_SIZE, LOG_SAMPLE_RATE
+
+_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+_min_level = _LEVELS.get(LOG_LEVEL.lower(), _LEVELS["info"])
+
+# Correlation id of the request being handled in the current context
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+
+# Records waiting for the writer thread, so callers never block on stdout
+_records: "queue.Queue[dict]" = queue.Queue(maxsize=LOG_BUFFER_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+# Counters of records that never made it to the output
+_dropped = 0
+_sampled_out = 0
+
+# Seconds the writer waits for a record before checking for unreported drops
+_DROP_CHECK_INTERVAL = 1.0
+
+# Sampled out records are expected, so they are only reported this often
+_SAMPLED_OUT_REPORT_INTERVAL = 60.0
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """Sets the correlation id attached to the records logged in the current context."""
+    request_id = request_id or uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+
+def _write_records() -> None:
+    """Writes queued records as JSON lines, reporting discarded records as they happen."""
+    reported_drops = reported_sampled_out = 0
+    last_check = last_sampled_out_report = time.time()
+
+    while True:
+        try:
+            record = _records.get(timeout=_DROP_CHECK_INTERVAL)
+        except queue.Empty:
+            record = None
+
+        if record is not None:
+            _write_line(record)
+
+        # Records still buffered were queued before the drops, so the report
+        # waits for them, unless the buffer stays busy for a whole interval
+        drops = _dropped
+        sampled_out = _sampled_out
+        now = time.time()
+
+        drops_due = drops != reported_drops and (
+            _records.empty() or now - last_check >= _DROP_CHECK_INTERVAL
+        )
+        sampled_out_due = (
+            sampled_out != reported_sampled_out
+            and now - last_sampled_out_report >= _SAMPLED_OUT_REPORT_INTERVAL
+        )
+
+        if drops_due or sampled_out_due:
+            # Drops that are not due yet stay pending, to keep their order
+            if not drops_due:
+                drops = reported_drops
+
+            _write_line(
+                {
+                    "time": time.time(),
+                    "level": "warning" if drops_due else "info",
+                    "event": "log_records_discarded",
+                    "dropped": drops - reported_drops,
+                    "dropped_total": drops,
+                    "sampled_out": sampled_out - reported_sampled_out,
+                    "sampled_out_total": sampled_out,
+                }
+            )
+            reported_drops = drops
+            reported_sampled_out = sampled_out
+            last_sampled_out_report = now
+
+        if drops == reported_drops:
+            last_check = now
+
+        if record is not None:
+            _records.task_done()
+
+
+def _write_line(record: dict) -> None:
+    try:
+        sys.stdout.write(json.dumps(record, default=str) + "\n")
+        sys.stdout.flush()
+    except Exception:
+        pass  # Logging must never take the writer thread down
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None:
+        return
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_write_records, name="event-logger", daemon=True
+            )
+            _writer.start()
+
+
+def _flush(timeout: float = 2.0) -> None:
+    """Gives the writer thread a moment to drain the buffer on exit."""
+    deadline = time.time() + timeout
+    while _writer is not None and _records.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.01)
+
+
+atexit.register(_flush)
+
+
+def log_event(
+    event: str,
+    level: str = "info",
+    sampled: bool = False,
+    exc_info: bool = False,
+    **fields,
+) -> None:
+    """
+    Queues a structured log record without blocking the caller.
+
+    Args:
+        event (str): A short, stable name for what happened.
+        level (str, optional): One of debug, info, warning or error. Defaults to info.
+        sampled (bool, optional): Whether this is a high-volume event subject to
+            LOG_SAMPLE_RATE. Defaults to False.
+        exc_info (bool, optional): Attach the traceback of the exception being
+            handled. Defaults to False.
+        **fields: Extra data to include in the record.
+    """
+    global _dropped, _sampled_out
+
+    if _LEVELS.get(level, _LEVELS["info"]) < _min_level:
+        return
+
+    if sampled and random.random() >= LOG_SAMPLE_RATE:
+        _sampled_out += 1
+        return
+
+    record = {"time": time.time(), "level": level, "event": event}
+
+    request_id = _request_id.get()
+    if request_id:
+        record["request_id"] = request_id
+
+    record.update(fields)
+
+    if exc_info:
+        record["traceback"] = traceback.format_exc()
+
+    _ensure_writer()
+
+    try:
+        _records.put_nowait(record)
+    except queue.Full:
+        _dropped += 1
@@ -1,5 +1,5 @@
 from typing import Dict, List, Optional, Union
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, StrictInt
 
 
 class Message(BaseModel):
@@ -66,7 +66,7 @@ class Session(BaseModel):
 class EmbeddingsRequest(BaseModel):
     """Represents an embeddings request to the OpenAI API."""
 
-    input: Union[str, List[str], List[List[int]]] = Field(
+    input: Union[str, List[str], List[StrictInt], List[List[StrictInt]]] = Field(
         ..., description="Input text to embed, encoded as a string or array of tokens."
     )
     model: str = Field(..., description="ID of the model to use.")
@@ -103,3 +103,40 @@ class EmbeddingsResponse(BaseModel):
         ..., description="The ID of the model used to generate the embeddings."
     )
     usage: dict = Field(..., description="The usage statistics for the request.")
+
+
+class BatchRequestLine(BaseModel):
+    """Represents a single line of a batch input file."""
+
+    custom_id: str = Field(
+        ..., description="A developer-provided ID used to match outputs to inputs."
+    )
+    method: str = Field("POST", description="The HTTP method of the request.")
+    url: str = Field(
+        ..., description="The endpoint to run the request against, e.g. /v1/embeddings."
+    )
+    body: dict = Field(..., description="The request body for the endpoint.")
+
+
+class Batch(BaseModel):
+    """Represents an asynchronous batch job."""
+
+    id: str = Field(..., description="The batch identifier.")
+    object: str = Field("batch", description="The object type.")
+    status: str = Field(
+        "validating",
+        description="One of validating, in_progress, cancelling, cancelled, completed or failed.",
+    )
+    priority: str = Field(
+        "low", description="low batches yield to interactive traffic, normal ones do not."
+    )
+    errors: Optional[str] = Field(None, description="The reason the batch failed.")
+    created_at: int = Field(..., description="Unix timestamp of the batch creation.")
+    in_progress_at: Optional[int] = Field(None, description="When processing started.")
+    completed_at: Optional[int] = Field(None, description="When the batch completed.")
+    cancelled_at: Optional[int] = Field(None, description="When the batch was cancelled.")
+    failed_at: Optional[int] = Field(None, description="When the batch failed.")
+    request_counts: Dict[str, int] = Field(
+        default_factory=lambda: {"total": 0, "completed": 0, "failed": 0},
+        description="Progress of the requests within the batch.",
+    )
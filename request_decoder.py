@@ -0,0 +1,56 @@
+from typing import List, Type, TypeVar, Union
+
+import orjson
+from pydantic import BaseModel
+
+from models import EmbeddingsRequest
+
+RequestModel = TypeVar("RequestModel", bound=BaseModel)
+
+
+def decode_request(model: Type[RequestModel], raw_body: bytes) -> RequestModel:
+    """
+    Decodes a raw JSON request body straight into a validated request model.
+
+    Raises:
+        ValueError: If the body is not valid JSON or does not match the model.
+    """
+    return model.model_validate(orjson.loads(raw_body))
+
+
+def split_embedding_inputs(
+    embedding_request: EmbeddingsRequest,
+) -> Union[List[str], List[List[int]]]:
+    """Returns the input of an embeddings request as a list of texts or of token id lists."""
+
+    # The input was validated as one of the union's homogeneous types, so
+    # looking at the first item is enough to tell them apart
+    inputs = embedding_request.input
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    if not inputs:
+        raise ValueError("Input must not be empty")
+
+    return inputs
+
+
+def prepare_token_ids(
+    inputs: List[List[int]], vocab_size: int, max_length: int
+) -> List[List[int]]:
+    """
+    Validates token id inputs against a model's vocabulary.
+
+    Inputs longer than max_length are truncated to it, as the tokenizer does
+    for text inputs.
+    """
+    prepared = []
+
+    for token_ids in inputs:
+        if not token_ids:
+            raise ValueError("Token id inputs must not be empty")
+        if min(token_ids) < 0 or max(token_ids) >= vocab_size:
+            raise ValueError(f"Token ids must be between 0 and {vocab_size - 1}")
+        prepared.append(token_ids[:max_length])
+
+    return prepared
@@ -5,6 +5,7 @@ import time
 import random
 
 from models import ChatCompletionChunk, MessageData, Message
+from event_logger import log_event
 
 
 # Function to generate a random completion ID
@@ -88,8 +89,12 @@ async def process_message_chunks(
             accumulated_response_text += completion_chunk  # Update tracked content
 
         except Exception as e:
-            print(f"Error on chunk processing: {str(e)}")
-            print(str(message_chunk))
+            log_event(
+                "chunk_processing_failed",
+                level="error",
+                error=str(e),
+                chunk=message_chunk,
+            )
             raise e
 
 
@@ -1,35 +1,40 @@
-import torch
-from transformers import AutoModel
+import asyncio
 
 import uvicorn
-import traceback
 
 # from setting_loader import PORT, API_KEY
 from fastapi import FastAPI, HTTPException, Header, Request, Response, status
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from models import (
-    ChatCompletionRequest,
-    EmbeddingsRequest,
-    Embedding,
-    EmbeddingsResponse,
-)
+from models import ChatCompletionRequest, EmbeddingsRequest
 
-from api_client import get_new_session, send_chat_completion_request
+from event_logger import log_event, set_request_id
+from request_decoder import decode_request
+from api_client import (
+    get_new_session,
+    send_chat_completion_request,
+    batch_chat_completion,
+)
+from embedding_processor import compute_embeddings, batch_embeddings
 from response_processor import process_streaming_request, process_normal_request
-from settings import PORT, API_KEY, EMBEDDING_MODEL
+from batch_processor import (
+    register_batch_handler,
+    interactive_request,
+    hold_interactive_request,
+    create_batch,
+    get_batch,
+    list_batches,
+    read_batch_output,
+    cancel_batch,
+    resume_batches,
+    shutdown_batches,
+)
+from settings import PORT, API_KEY
 
 
 app = FastAPI()
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-embedding_model = AutoModel.from_pretrained(
-    EMBEDDING_
-    MODEL,
-    trust_remote_code=True,
-).to(device)
-
 
 # Config Middleware
 app.add_middleware(
@@ -41,6 +46,38 @@ app.add_middleware(
 )
 
 
+register_batch_handler("/v1/embeddings", batch_embeddings)
+register_batch_handler("/v1/chat/completions", batch_chat_completion)
+
+
+@app.on_event("startup")
+async def start_batches():
+    """Resume batches interrupted by the last shutdown"""
+    resume_batches()
+
+
+@app.on_event("shutdown")
+async def stop_batches():
+    """Stop running batches, keeping them resumable"""
+    await shutdown_batches()
+
+
+def verify_api_key(authorization: str):
+    """Raises a 401 error unless the authorization header holds the API key."""
+    provided_api_key = authorization.split(" ")[1] if authorization else None
+    if provided_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Incorrect API key")
+
+
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    """Tag the logs of each request with a correlation id"""
+    request_id = set_request_id(request.headers.get("x-request-id"))
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 @app.options("/v1/embeddings", status_code=status.HTTP_200_OK)
 async def embeddings_options():
     """Accept completions Request"""
@@ -52,46 +89,17 @@ async def handle_embeddings(request: Request, authorization: str = Header(None))
     """Handles embeddings requests."""
 
     # Check API key authorization
-    provided_api_key = authorization.split(" ")[1] if authorization else None
-    if provided_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Incorrect API key")
+    verify_api_key(authorization)
 
     try:
-        # Parse request body
-        body = await request.json()
-        embedding_request = EmbeddingsRequest(**body)
-
-        # pylint: disable=not-an-iterable
-        # Handle different input types
-        if isinstance(embedding_request.input, str):
-            inputs = [embedding_request.input]
-        elif hasattr(embedding_request.input, "__iter__"):  # Check if it's iterable
-            if all(isinstance(x, str) for x in embedding_request.input):
-                inputs = embedding_request.input
-            elif all(isinstance(x, list) for x in embedding_request.input):
-                inputs = [" ".join(map(str, x)) for x in embedding_request.input]
-            else:
-                raise ValueError("Invalid input type")
-        else:
-            raise ValueError("Invalid input type")
-
-        # Calculate embeddings
-        with torch.no_grad():
-            embeddings = embedding_model.encode(inputs)
-
-        # Create EmbeddingsResponse
-        embedding_response = EmbeddingsResponse(
-            object="list",
-            data=[
-                Embedding(object="embedding", index=i, embedding=embedding.tolist())
-                for i, embedding in enumerate(embeddings)
-            ],
-            model=embedding_request.model,
-            usage={
-                "prompt_tokens": len(inputs),
-                "total_tokens": len(inputs),
-            },  # adjust usage stats as needed
-        )
+        # Decode the raw request body straight into the validated model
+        embedding_request = decode_request(EmbeddingsRequest, await request.body())
+
+        # Off the event loop, so batches waiting on the model can see the request
+        async with interactive_request():
+            embedding_response = await asyncio.to_thread(
+                compute_embeddings, embedding_request
+            )
 
         # Return serialized EmbeddingsResponse as JSON
         return JSONResponse(
@@ -117,56 +125,144 @@ async def handle_chat_completion(request: Request, authorization: str = Header(N
     """Handles chat completion requests."""
 
     # Check API key authorization
-    provided_api_key = authorization.split(" ")[1] if authorization else None
-    if provided_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Incorrect API key")
+    verify_api_key(authorization)
 
     try:
-        # Parse request body
-        body = await request.json()
-        chat_completion_request = ChatCompletionRequest(**body)
-
-        # Get a new session
-        session = await get_new_session()
-        if not session:
-            raise HTTPException(
-                status_code=503, detail="Failed to obtain a session from OpenAI API"
-            )
+        # Decode the raw request body straight into the validated model
+        chat_completion_request = decode_request(
+            ChatCompletionRequest, await request.body()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}") from e
 
-        # Send chat completion request
-        response = send_chat_completion_request(chat_completion_request, session)
-
-        # Process response based on streaming
-        if chat_completion_request.stream:
-            headers = {
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-            }
-            return StreamingResponse(
-                process_streaming_request(chat_completion_request.messages, response),
-                media_type="text/event-stream",
-                headers=headers,
-            )
-        else:
-            return Response(
-                content=await process_normal_request(
-                    chat_completion_request.messages, response
-                ),
-                media_type="application/json",
-                headers={"Content-Type": "application/json"},
-            )
+    try:
+        async with interactive_request() as in_flight:
+            # Get a new session
+            session = await get_new_session()
+            if not session:
+                raise HTTPException(
+                    status_code=503, detail="Failed to obtain a session from OpenAI API"
+                )
+
+            # Send chat completion request
+            response = send_chat_completion_request(chat_completion_request, session)
+
+            # Process response based on streaming
+            if chat_completion_request.stream:
+                headers = {
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive",
+                    "Content-Type": "text/event-stream",
+                }
+                return StreamingResponse(
+                    hold_interactive_request(
+                        in_flight,
+                        process_streaming_request(chat_completion_request.messages, response)
+                    ),
+                    media_type="text/event-stream",
+                    headers=headers,
+                )
+            else:
+                return Response(
+                    content=await process_normal_request(
+                        chat_completion_request.messages, response
+                    ),
+                    media_type="application/json",
+                    headers={"Content-Type": "application/json"},
+                )
     except Exception as e:
-        print(f"Error handling chat completion: {e}")
-        traceback.print_exc()
+        log_event(
+            "chat_completion_failed", level="error", error=str(e), exc_info=True
+        )
         raise HTTPException(
             status_code=500, detail="An unexpected error occurred..."
         ) from e
 
 
+@app.post("/v1/batches")
+async def handle_create_batch(
+    request: Request, priority: str = "low", authorization: str = Header(None)
+):
+    """Creates a batch from a JSONL file posted as the request body."""
+
+    # Check API key authorization
+    verify_api_key(authorization)
+
+    try:
+        batch = await create_batch(await request.body(), priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {e}") from e
+
+    return JSONResponse(content=batch.model_dump())
+
+
+@app.get("/v1/batches")
+async def handle_list_batches(authorization: str = Header(None)):
+    """Lists the known batches."""
+
+    # Check API key authorization
+    verify_api_key(authorization)
+
+    return JSONResponse(
+        content={
+            "object": "list",
+            "data": [batch.model_dump() for batch in list_batches()],
+        }
+    )
+
+
+@app.get("/v1/batches/{batch_id}")
+async def handle_get_batch(batch_id: str, authorization: str = Header(None)):
+    """Returns the status and progress of a batch."""
+
+    # Check API key authorization
+    verify_api_key(authorization)
+
+    batch = get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    return JSONResponse(content=batch.model_dump())
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def handle_cancel_batch(batch_id: str, authorization: str = Header(None)):
+    """Cancels a batch."""
+
+    # Check API key authorization
+    verify_api_key(authorization)
+
+    batch = await cancel_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    return JSONResponse(content=batch.model_dump())
+
+
+@app.get("/v1/batches/{batch_id}/output")
+async def handle_batch_output(batch_id: str, authorization: str = Header(None)):
+    """Returns the results a batch has written so far as JSONL."""
+
+    # Check API key authorization
+    verify_api_key(authorization)
+
+    output = read_batch_output(batch_id)
+    if output is None:
+        raise HTTPException(status_code=404, detail="Batch output not found")
+
+    chunks, size = output
+    return StreamingResponse(
+        chunks,
+        media_type="application/jsonl",
+        headers={"Content-Length": str(size)},
+    )
+
+
 # Start the server
 if __name__ == "__main__":
-    print(f"💡 Server is running at http://localhost:{PORT}")
-    print(f"🔗 Local Base URL: http://localhost:{PORT}/v1")
-    print(f"🔗 Local Endpoint: http://localhost:{PORT}/v1/chat/completions")
+    log_event(
+        "server_starting",
+        base_url=f"http://localhost:{PORT}/v1",
+        endpoint=f"http://localhost:{PORT}/v1/chat/completions",
+    )
     uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -45,3 +45,24 @@ PROXY_PASSWORD = os.getenv("PROXY_PASSWORD")
 
 # Embedding Model Name & Path
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+
+# Batch jobs configuration
+BATCH_DIR = Path(os.getenv("BATCH_DIR", str(Path(__file__).parent / "batches")))
+BATCH_CONCURRENCY = int(
+    os.getenv("BATCH_CONCURRENCY", "4")
+)  # Maximum number of batch lines executed at the same time
+BATCH_MAX_INTERACTIVE_REQUESTS = int(
+    os.getenv("BATCH_MAX_INTERACTIVE_REQUESTS", "0")
+)  # Low priority batches wait while more interactive requests than this are in flight
+BATCH_MAX_YIELD_SECONDS = float(
+    os.getenv("BATCH_MAX_YIELD_SECONDS", "5")
+)  # Longest a low priority batch waits before dispatching a line anyway
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+LOG_BUFFER_SIZE = int(
+    os.getenv("LOG_BUFFER_SIZE", "10000")
+)  # Records kept waiting for stdout before new ones are dropped
+LOG_SAMPLE_RATE = float(
+    os.getenv("LOG_SAMPLE_RATE", "1.0")
+)  # Fraction of high-volume records that are kept
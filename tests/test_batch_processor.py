@@ -0,0 +1,220 @@
+import asyncio
+import json
+
+import pytest
+
+import batch_processor
+from settings import BATCH_CONCURRENCY
+
+URL = "/v1/test"
+
+
+@pytest.fixture
+def batches(tmp_path, monkeypatch):
+    """Gives each test a fresh batch directory and module state."""
+    monkeypatch.setattr(batch_processor, "BATCH_DIR", tmp_path)
+    monkeypatch.setattr(batch_processor, "BATCH_MAX_YIELD_SECONDS", 10)
+    monkeypatch.setattr(batch_processor, "_handlers", {})
+    monkeypatch.setattr(batch_processor, "_batches", {})
+    monkeypatch.setattr(batch_processor, "_tasks", {})
+    monkeypatch.setattr(batch_processor, "_worker_slots", None)
+    monkeypatch.setattr(batch_processor, "_interactive_idle", None)
+    monkeypatch.setattr(batch_processor, "_interactive_requests", 0)
+    return batch_processor
+
+
+def make_input(count: int, failing=()) -> bytes:
+    return "\n".join(
+        json.dumps({"custom_id": f"line-{i}", "url": URL, "body": {"fail": i in failing}})
+        for i in range(count)
+    ).encode()
+
+
+def read_output(batch_id: str) -> list:
+    output_file = batch_processor.BATCH_DIR / batch_id / "output.jsonl"
+    return [json.loads(line) for line in output_file.read_text().splitlines()]
+
+
+def read_stored_batch(batch_id: str) -> dict:
+    return json.loads((batch_processor.BATCH_DIR / batch_id / "batch.json").read_text())
+
+
+async def wait_until(predicate, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+async def echo(body: dict) -> dict:
+    await asyncio.sleep(0.005)
+    if body.get("fail"):
+        raise ValueError("requested failure")
+    return body
+
+
+def test_counts_completed_and_failed_lines(batches):
+    async def main():
+        batches.register_batch_handler(URL, echo)
+        batch = await batches.create_batch(make_input(10, failing={3, 7}))
+        await batches._tasks[batch.id]
+        return batch
+
+    batch = asyncio.run(main())
+
+    assert batch.status == "completed"
+    assert batch.request_counts == {"total": 10, "completed": 8, "failed": 2}
+    assert read_stored_batch(batch.id)["status"] == "completed"
+
+    results = {result["custom_id"]: result for result in read_output(batch.id)}
+    assert len(results) == 10
+    assert results["line-3"]["error"]["message"] == "requested failure"
+    assert results["line-0"]["response"]["body"] == {"fail": False}
+
+
+def test_rejects_unknown_urls(batches):
+    async def main():
+        with pytest.raises(ValueError, match="unsupported url"):
+            await batches.create_batch(make_input(1))
+
+    asyncio.run(main())
+
+
+def test_cancel_mid_run(batches):
+    async def main():
+        release = asyncio.Event()
+
+        async def blocked(body: dict) -> dict:
+            await release.wait()
+            return body
+
+        batches.register_batch_handler(URL, blocked)
+        batch = await batches.create_batch(make_input(20))
+        await wait_until(lambda: batches._get_worker_slots()._value == 0)
+
+        await batches.cancel_batch(batch.id)
+        return batch
+
+    batch = asyncio.run(main())
+
+    assert batch.status == "cancelled"
+    assert batch.cancelled_at is not None
+    assert read_stored_batch(batch.id)["status"] == "cancelled"
+    assert read_output(batch.id) == []
+    assert batches._get_worker_slots()._value == BATCH_CONCURRENCY
+
+
+def test_resume_after_shutdown_skips_finished_lines(batches):
+    calls = []
+
+    async def counting(body: dict) -> dict:
+        calls.append(body["i"])
+        await asyncio.sleep(0.01)
+        return body
+
+    content = "\n".join(
+        json.dumps({"custom_id": f"line-{i}", "url": URL, "body": {"i": i}})
+        for i in range(30)
+    ).encode()
+
+    async def main():
+        batches.register_batch_handler(URL, counting)
+        batch = await batches.create_batch(content)
+        await wait_until(lambda: batch.request_counts["completed"] >= 8)
+        await batches.shutdown_batches()
+
+        assert read_stored_batch(batch.id)["status"] == "in_progress"
+        finished = {result["custom_id"] for result in read_output(batch.id)}
+
+        # A restart starts from what is on disk only
+        batches._batches.clear()
+        batches.resume_batches()
+        resumed = batches.get_batch(batch.id)
+        await batches._tasks[batch.id]
+        return resumed, finished
+
+    batch, finished = asyncio.run(main())
+
+    custom_ids = [result["custom_id"] for result in read_output(batch.id)]
+    assert batch.status == "completed"
+    assert batch.request_counts["completed"] == 30
+    assert len(custom_ids) == len(set(custom_ids)) == 30
+    # Lines with a result before the shutdown were not run again
+    assert all(calls.count(int(custom_id.split("-")[1])) == 1 for custom_id in finished)
+
+
+def test_resume_truncates_partial_trailing_line(batches):
+    async def main():
+        batches.register_batch_handler(URL, echo)
+        batch = await batches.create_batch(make_input(12))
+        await wait_until(lambda: batch.request_counts["completed"] >= 4)
+        await batches.shutdown_batches()
+
+        output_file = batches.BATCH_DIR / batch.id / "output.jsonl"
+        with open(output_file, "a", encoding="utf-8") as output:
+            output.write('{"id": "batch_req_cut", "custom_id": "line-11", "resp')
+
+        # The partial line is not served while the batch is stopped
+        chunks, size = batches.read_batch_output(batch.id)
+        assert b"".join(chunks).endswith(b"}\n")
+
+        batches._batches.clear()
+        batches.resume_batches()
+        await batches._tasks[batch.id]
+        return batches.get_batch(batch.id)
+
+    batch = asyncio.run(main())
+
+    custom_ids = [result["custom_id"] for result in read_output(batch.id)]
+    assert batch.status == "completed"
+    assert sorted(custom_ids) == sorted(f"line-{i}" for i in range(12))
+
+
+def test_low_priority_waits_for_interactive_requests(batches):
+    async def main():
+        batches.register_batch_handler(URL, echo)
+
+        async with batches.interactive_request():
+            low = await batches.create_batch(make_input(5))
+            normal = await batches.create_batch(make_input(5), priority="normal")
+            await batches._tasks[normal.id]
+            await asyncio.sleep(0.05)
+            assert low.request_counts["completed"] == 0
+
+        await batches._tasks[low.id]
+        return low, normal
+
+    low, normal = asyncio.run(main())
+
+    assert low.status == normal.status == "completed"
+    assert low.request_counts["completed"] == 5
+
+
+def test_low_priority_is_not_starved(batches, monkeypatch):
+    monkeypatch.setattr(batches, "BATCH_MAX_YIELD_SECONDS", 0.01)
+
+    async def main():
+        batches.register_batch_handler(URL, echo)
+
+        async with batches.interactive_request():
+            batch = await batches.create_batch(make_input(3))
+            await batches._tasks[batch.id]
+            return batch
+
+    assert asyncio.run(main()).status == "completed"
+
+
+def test_stream_keeps_interactive_request_in_flight(batches):
+    async def stream():
+        yield "chunk"
+
+    async def main():
+        async with batches.interactive_request() as in_flight:
+            held = batches.hold_interactive_request(in_flight, stream())
+
+        # Handing over leaves no gap between the handler and the stream
+        assert batches._interactive_requests == 1
+        assert [chunk async for chunk in held] == ["chunk"]
+        assert batches._interactive_requests == 0
+
+    asyncio.run(main())